@@ -1,8 +1,15 @@
+import asyncio
+import datetime
+import io
 import logging
 import os
 import mimetypes
 import json
-from pathlib import Path
+import random
+import re
+import tempfile
+import threading
+import time
 
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
@@ -15,12 +22,15 @@ from telegram.ext import (
     CallbackQueryHandler,
 )
 
+import filetype
+import httplib2
 from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
-from googleapiclient.http import MediaFileUpload
+from googleapiclient.http import HttpRequest, MediaIoBaseUpload
 
 # Enable logging
 logging.basicConfig(
@@ -33,184 +43,528 @@ TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 GOOGLE_DRIVE_PARENT_FOLDER_ID = os.getenv('GOOGLE_DRIVE_PARENT_FOLDER_ID')
 GOOGLE_CREDENTIALS_JSON = os.getenv('GOOGLE_CREDENTIALS_JSON')
 GOOGLE_TOKEN_JSON = os.getenv('GOOGLE_TOKEN_JSON')
+# Public HTTPS URL of the deployment (e.g. on Railway): when set the bot uses a webhook instead of polling
+PUBLIC_URL = os.getenv('PUBLIC_URL')
+WEBHOOK_PORT = int(os.getenv('PORT', '8443'))
+# Sent by Telegram in every webhook request, requests without it are rejected
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+def load_json_env(var_name, raw_value):
+    """Parses a JSON environment variable, returning None if it is unset or invalid."""
+    if not raw_value:
+        return None
+    try:
+        return json.loads(raw_value)
+    except json.JSONDecodeError as e:
+        logger.error("Invalid JSON in %s: %s", var_name, e)
+        return None
+
+# Parsed once at startup instead of on every credentials (re)load
+GOOGLE_CREDENTIALS_INFO = load_json_env('GOOGLE_CREDENTIALS_JSON', GOOGLE_CREDENTIALS_JSON)
+GOOGLE_TOKEN_INFO = load_json_env('GOOGLE_TOKEN_JSON', GOOGLE_TOKEN_JSON)
 
 # --- 🔒 USER ACCESS CONTROL ---
-# Carica l'ID utente autorizzato dalla variabile d'ambiente o usa un valore di default
-AUTHORIZED_USER_ID = int(os.getenv('TELEGRAM_ID', '123456789'))
+# Carica gli ID utente autorizzati dalla variabile d'ambiente (separati da virgola) o usa un valore di default
+AUTHORIZED_USER_IDS = frozenset(
+    int(user_id) for user_id in os.getenv('TELEGRAM_ID', '123456789').split(',') if user_id.strip()
+)
 # Per trovare il tuo ID: scrivi a @userinfobot o @getidsbot su Telegram
 
 # Define conversation states
 GET_PATH, CONFIRM_UPLOAD, SELECT_FOLDER, WAITING_FOR_MORE_FILES, CONFIRM_DELETE, LIST_FILES, SEARCH_FILES = range(7)
 
+# How long (seconds) a path resolved in get_path can be reused without asking Drive again
+PATH_RESOLUTION_TTL = 30
+
+# Confirmation answers, compared after lowercasing and stripping accents
+YES_NO_PATTERN = re.compile(r'^(s[iì]|no)$', re.IGNORECASE)
+YES_NO_ANSWERS = frozenset({'si', 'no'})
+ACCENTS_TABLE = str.maketrans('àèéìòù', 'aeeiou')
+
 # --- Google Drive Setup ---
 SCOPES = ['https://www.googleapis.com/auth/drive']
 DRIVE_SERVICE = None
+DRIVE_SERVICE_LOCK = threading.Lock()
+DRIVE_CREDENTIALS = None
+THREAD_LOCAL = threading.local()
+HTTP_TIMEOUT = 60
+# Retries for 429 and 5xx responses, with randomized exponential backoff (done by googleapiclient).
+# Only for idempotent calls: folder creation is retried by create_folder, which checks first,
+# and multipart uploads and deletes are not retried.
+DRIVE_NUM_RETRIES = 5
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+TOKEN_PATH = os.getenv('TOKEN_PATH', 'token.json')
+TOKEN_REFRESH_MARGIN = datetime.timedelta(minutes=5)
+TOKEN_CHECK_INTERVAL = 60
 
 def get_drive_service():
     global DRIVE_SERVICE
     if DRIVE_SERVICE:
         return DRIVE_SERVICE
 
+    # Handlers call this from worker threads: only one of them may run the OAuth flow and build()
+    with DRIVE_SERVICE_LOCK:
+        if DRIVE_SERVICE is None:
+            DRIVE_SERVICE = build_drive_service()
+    return DRIVE_SERVICE
+
+def load_saved_credentials():
+    """Returns the first usable token: the one saved at TOKEN_PATH, then GOOGLE_TOKEN_JSON.
+
+    The file comes first because it holds the latest refresh, while the env var
+    is only updated by hand.
+    """
+    sources = []
+    if os.path.exists(TOKEN_PATH):
+        sources.append((f"'{TOKEN_PATH}'", lambda: Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)))
+    if GOOGLE_TOKEN_INFO:
+        sources.append(("GOOGLE_TOKEN_JSON env var", lambda: Credentials.from_authorized_user_info(GOOGLE_TOKEN_INFO, SCOPES)))
+
+    for source, load in sources:
+        try:
+            creds = load()
+            if not creds.valid:
+                if not (creds.expired and creds.refresh_token):
+                    logger.warning("Credentials from %s are not usable.", source)
+                    continue
+                logger.info("Credentials from %s expired. Refreshing...", source)
+                creds.refresh(Request())
+                save_token(creds)
+            logger.info("Credentials loaded from %s.", source)
+            return creds
+        except Exception as e:
+            logger.error("Failed to use credentials from %s: %s", source, e)
+    return None
+
+def build_drive_service():
+    global DRIVE_CREDENTIALS
     creds = None
-    token_path = 'token.json'
     
     # Forza la riautenticazione se richiesto
     force_reauth = os.getenv('FORCE_REAUTH', 'false').lower() == 'true'
     
-    if GOOGLE_TOKEN_JSON and not force_reauth:
-        try:
-            creds_data = json.loads(GOOGLE_TOKEN_JSON)
-            creds = Credentials.from_authorized_user_info(creds_data, SCOPES)
-            logger.info("Credentials loaded from GOOGLE_TOKEN_JSON env var.")
-        except json.JSONDecodeError:
-            logger.error("Invalid JSON in GOOGLE_TOKEN_JSON.")
-            creds = None
-    elif os.path.exists(token_path):
-        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-        logger.info(f"Credentials loaded from '{token_path}'.")
-
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                logger.info("Credentials expired. Refreshing...")
-                creds.refresh(Request())
-            except Exception as refresh_error:
-                logger.error(f"Failed to refresh token: {refresh_error}")
-                logger.info("Token refresh failed. Starting new OAuth flow...")
-                creds = None
+    if not force_reauth:
+        creds = load_saved_credentials()
+
+    if not creds:
+        logger.info("No valid credentials found. Starting OAuth flow.")
+        if not GOOGLE_CREDENTIALS_JSON:
+            logger.error("GOOGLE_CREDENTIALS_JSON env var not set.")
+            raise ValueError("GOOGLE_CREDENTIALS_JSON not found.")
         
-        if not creds:
-            logger.info("No valid credentials found. Starting OAuth flow.")
-            if not GOOGLE_CREDENTIALS_JSON:
-                logger.error("GOOGLE_CREDENTIALS_JSON env var not set.")
-                raise ValueError("GOOGLE_CREDENTIALS_JSON not found.")
-            
-            try:
-                creds_info = json.loads(GOOGLE_CREDENTIALS_JSON)
-                flow = InstalledAppFlow.from_client_config(creds_info, SCOPES)
-                creds = flow.run_local_server(port=0)
-            except (json.JSONDecodeError, KeyError) as e:
-                logger.error(f"Error parsing GOOGLE_CREDENTIALS_JSON: {e}")
-                raise ValueError("GOOGLE_CREDENTIALS_JSON is not valid JSON.")
-
-        token_json_content = creds.to_json()
-        with open(token_path, 'w') as token:
-            token.write(token_json_content)
-        logger.info(f"Token saved to {token_path}. For persistence, set GOOGLE_TOKEN_JSON env var.")
-        logger.info(token_json_content)
-
-    DRIVE_SERVICE = build('drive', 'v3', credentials=creds)
+        if GOOGLE_CREDENTIALS_INFO is None:
+            raise ValueError("GOOGLE_CREDENTIALS_JSON is not valid JSON.")
+        
+        try:
+            flow = InstalledAppFlow.from_client_config(GOOGLE_CREDENTIALS_INFO, SCOPES)
+            creds = flow.run_local_server(port=0)
+        except KeyError as e:
+            logger.error("Error parsing GOOGLE_CREDENTIALS_JSON: %s", e)
+            raise ValueError("GOOGLE_CREDENTIALS_JSON is not valid JSON.")
+
+        save_token(creds)
+
+    DRIVE_CREDENTIALS = creds
+
+    # The Drive v3 discovery document ships with the client library: no fetch on startup
+    service = build(
+        'drive', 'v3',
+        http=get_thread_http(),
+        requestBuilder=build_thread_request,
+        static_discovery=True,
+        cache_discovery=False,
+    )
     logger.info("Google Drive service initialized successfully.")
-    return DRIVE_SERVICE
+    return service
+
+def get_thread_http():
+    """Returns the authorized Http of the current thread.
+
+    httplib2.Http isn't thread-safe, and Drive calls run in worker threads: each thread
+    keeps its own connection to Google alive across calls, so TLS handshakes aren't
+    repeated for every request.
+    """
+    http = getattr(THREAD_LOCAL, 'http', None)
+    if http is None:
+        http = THREAD_LOCAL.http = AuthorizedHttp(DRIVE_CREDENTIALS, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+    return http
+
+def build_thread_request(http, *args, **kwargs):
+    return HttpRequest(get_thread_http(), *args, **kwargs)
+
+def save_token(creds):
+    """Atomically writes the credentials to TOKEN_PATH, so a restart doesn't need a new OAuth flow."""
+    token_dir = os.path.dirname(os.path.abspath(TOKEN_PATH))
+    try:
+        with tempfile.NamedTemporaryFile('w', dir=token_dir, suffix='.tmp', delete=False) as tmp:
+            tmp.write(creds.to_json())
+        os.replace(tmp.name, TOKEN_PATH)
+        logger.info("Token saved to %s. For persistence, set GOOGLE_TOKEN_JSON env var or mount a volume.", TOKEN_PATH)
+    except OSError as e:
+        logger.error("Could not save token to %s: %s", TOKEN_PATH, e)
 
-def find_or_create_nested_folder(service, path_string: str, root_folder_id: str):
+def refresh_credentials_if_needed():
+    """Refreshes the Drive credentials shortly before they expire and saves the new token."""
+    creds = DRIVE_CREDENTIALS
+    if not creds or not creds.refresh_token or not creds.expiry:
+        return
+    # google-auth stores the expiry as a naive UTC datetime
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    if creds.expiry - now > TOKEN_REFRESH_MARGIN:
+        return
+    logger.info("Credentials about to expire. Refreshing...")
+    creds.refresh(Request())
+    save_token(creds)
+
+async def token_refresh_loop():
+    """Keeps the token fresh in the background, so users never wait for a refresh."""
+    while True:
+        await asyncio.sleep(TOKEN_CHECK_INTERVAL)
+        try:
+            await asyncio.to_thread(refresh_credentials_if_needed)
+        except Exception as e:
+            logger.error("Failed to refresh token: %s", e)
+
+# --- Folder Lookup Cache ---
+# Maps (parent_id, folder_name) -> (folder_id, expiry) so that frequently reused
+# paths (e.g. Fatture/2025/Amazon) don't cost one files().list call per segment.
+# The whole tree below the root is reloaded in the background about once per TTL.
+FOLDER_CACHE = {}
+FOLDER_CACHE_TTL = int(os.getenv('FOLDER_CACHE_TTL', '300'))
+FOLDER_TREE_REFRESH_INTERVAL = int(os.getenv('FOLDER_TREE_REFRESH_INTERVAL', str(FOLDER_CACHE_TTL)))
+# Reverse map folder_id -> (name, parent_id), used to build readable paths without API calls.
+# The bot never renames or moves folders, so entries don't expire.
+FOLDER_METADATA = {}
+# Fixed pool of locks, picked by hashing (parent_id, folder_name), so creations of the
+# same folder are serialized without keeping a lock for every folder ever created
+FOLDER_CREATION_LOCKS = [threading.Lock() for _ in range(64)]
+
+def get_cached_folder(parent_id, name):
+    entry = FOLDER_CACHE.get((parent_id, name))
+    if entry is None:
+        return None
+    folder_id, expiry = entry
+    if expiry < time.monotonic():
+        # Several worker threads may drop the same expired entry at once
+        FOLDER_CACHE.pop((parent_id, name), None)
+        return None
+    return folder_id
+
+def cache_folder(parent_id, name, folder_id):
+    FOLDER_CACHE[(parent_id, name)] = (folder_id, time.monotonic() + FOLDER_CACHE_TTL)
+    FOLDER_METADATA[folder_id] = (name, parent_id)
+
+def forget_folder(folder_id):
+    """Drops a folder that turned out to be gone from Drive, so the next lookup asks the API."""
+    metadata = FOLDER_METADATA.get(folder_id)
+    if metadata is not None:
+        name, parent_id = metadata
+        FOLDER_CACHE.pop((parent_id, name), None)
+
+def escape_drive_query(value):
+    """Escapes a value for use inside a single-quoted Drive query string."""
+    return value.replace('\\', '\\\\').replace("'", "\\'")
+
+def lookup_folders(service, names=None):
+    """Fetches all folders named like any of `names` (or every folder) with a single paginated query.
+
+    Returns a dict mapping (parent_id, name) -> folder_id.
+    """
+    query = "mimeType='application/vnd.google-apps.folder' and trashed=false"
+    if names:
+        name_clause = " or ".join(f"name='{escape_drive_query(name)}'" for name in names)
+        query += f" and ({name_clause})"
+    found = {}
+    page_token = None
+    while True:
+        results = service.files().list(
+            q=query,
+            spaces='drive',
+            pageSize=1000,
+            pageToken=page_token,
+            fields="nextPageToken, files(id, name, parents)"
+        ).execute(num_retries=DRIVE_NUM_RETRIES)
+        for item in results.get('files', []):
+            for parent_id in item.get('parents', []):
+                found.setdefault((parent_id, item['name']), item['id'])
+        page_token = results.get('nextPageToken')
+        if not page_token:
+            return found
+
+def load_folder_tree(service, root_folder_id):
+    """Primes FOLDER_CACHE with every folder below root_folder_id, so lookups start from memory."""
+    try:
+        found = lookup_folders(service)
+    except HttpError as error:
+        logger.error("Error loading the folder tree: %s", error)
+        return
+
+    children = {}
+    for (parent_id, name), folder_id in found.items():
+        children.setdefault(parent_id, []).append((name, folder_id))
+
+    # Only the subtree below the root folder is relevant to the bot
+    loaded = 0
+    pending = [root_folder_id]
+    while pending:
+        parent_id = pending.pop()
+        for name, folder_id in children.get(parent_id, []):
+            cache_folder(parent_id, name, folder_id)
+            loaded += 1
+            pending.append(folder_id)
+    logger.info("Folder tree loaded: %s folders cached.", loaded)
+
+async def folder_tree_refresh_loop():
+    """Loads the folder tree in the background and reloads it periodically, so startup isn't delayed."""
+    while True:
+        try:
+            service = await asyncio.to_thread(get_drive_service)
+            await asyncio.to_thread(load_folder_tree, service, GOOGLE_DRIVE_PARENT_FOLDER_ID)
+        except Exception as e:
+            logger.error("Failed to refresh the folder tree: %s", e)
+        await asyncio.sleep(FOLDER_TREE_REFRESH_INTERVAL)
+
+def resolve_path(service, path_string: str, root_folder_id: str):
+    """Walks a slash-separated path below root_folder_id.
+
+    Returns (folder_id, missing_parts): folder_id is the deepest folder found on the
+    path and missing_parts the segments below it that don't exist yet. Returns
+    (None, []) if a Drive call fails.
+    """
     current_folder_id = root_folder_id
     path_parts = [part.strip() for part in path_string.split('/') if part.strip()]
+    found = None
+
+    for index, part in enumerate(path_parts):
+        cached_id = get_cached_folder(current_folder_id, part)
+        if cached_id:
+            current_folder_id = cached_id
+            continue
+        try:
+            if found is None:
+                # One query for all remaining segments, the chain is then walked locally
+                found = lookup_folders(service, set(path_parts[index:]))
+                for (parent_id, name), folder_id in found.items():
+                    cache_folder(parent_id, name, folder_id)
+
+            folder_id = found.get((current_folder_id, part))
+            if not folder_id:
+                logger.info("Folder '%s' not found.", part)
+                return current_folder_id, path_parts[index:]
+            current_folder_id = folder_id
+            logger.info("Found folder '%s' with ID: %s", part, current_folder_id)
+        except HttpError as error:
+            logger.error("Error finding folder '%s': %s", part, error)
+            return None, []
+    return current_folder_id, []
+
+def create_folder(service, parent_id, name):
+    """Creates a single folder and returns its ID.
+
+    A failed create may still have been applied on Drive, so before each retry the
+    folder is looked up again and only created if it is still missing.
+    """
+    file_metadata = {'name': name, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [parent_id]}
+    for attempt in range(DRIVE_NUM_RETRIES + 1):
+        if attempt:
+            time.sleep(min(2 ** attempt, 32) * random.random())
+            existing_id = lookup_folders(service, [name]).get((parent_id, name))
+            if existing_id:
+                return existing_id
+        try:
+            return service.files().create(body=file_metadata, fields='id').execute().get('id')
+        except HttpError as error:
+            if error.resp.status not in RETRYABLE_STATUSES or attempt == DRIVE_NUM_RETRIES:
+                raise
+            logger.warning("Creating folder '%s' failed (%s), checking before retrying.", name, error.resp.status)
+        except OSError as error:
+            if attempt == DRIVE_NUM_RETRIES:
+                raise
+            logger.warning("Creating folder '%s' failed (%s), checking before retrying.", name, error)
 
+def create_folders(service, path_parts, parent_id):
+    """Creates a chain of nested folders below parent_id and returns the ID of the deepest one."""
+    current_folder_id = parent_id
+    created = False
     for part in path_parts:
+        key = (current_folder_id, part)
         try:
-            query = f"name='{part}' and mimeType='application/vnd.google-apps.folder' and '{current_folder_id}' in parents and trashed=false"
-            results = service.files().list(q=query, fields="files(id)").execute()
-            items = results.get('files', [])
-
-            if items:
-                current_folder_id = items[0]['id']
-                logger.info(f"Found folder '{part}' with ID: {current_folder_id}")
-            else:
-                logger.info(f"Folder '{part}' not found. Creating...")
-                file_metadata = {'name': part, 'mimeType': 'application/vnd.google-apps.folder', 'parents': [current_folder_id]}
-                folder = service.files().create(body=file_metadata, fields='id').execute()
-                current_folder_id = folder.get('id')
-                logger.info(f"Created folder '{part}' with ID: {current_folder_id}")
+            # Concurrent uploads into the same new path wait here instead of creating duplicates
+            with FOLDER_CREATION_LOCKS[hash(key) % len(FOLDER_CREATION_LOCKS)]:
+                existing_id = get_cached_folder(current_folder_id, part)
+                if not existing_id and not created:
+                    # The cache may have expired since another upload created it: ask Drive.
+                    # Below a folder created here nothing can exist yet, so the check stops there.
+                    existing_id = lookup_folders(service, [part]).get(key)
+                if existing_id:
+                    cache_folder(current_folder_id, part, existing_id)
+                    current_folder_id = existing_id
+                    continue
+                folder_id = create_folder(service, current_folder_id, part)
+                created = True
+                cache_folder(current_folder_id, part, folder_id)
+            current_folder_id = folder_id
+            logger.info("Created folder '%s' with ID: %s", part, current_folder_id)
         except HttpError as error:
-            logger.error(f"Error finding or creating folder '{part}': {error}")
+            logger.error("Error creating folder '%s': %s", part, error)
             return None
     return current_folder_id
 
-def upload_file_to_drive(service, file_path, folder_id):
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+RESUMABLE_UPLOAD_THRESHOLD = 5 * 1024 * 1024
+
+# Extensions that some platforms' mime.types don't know about
+mimetypes.add_type('text/markdown', '.md')
+mimetypes.add_type('audio/ogg', '.ogg')
+mimetypes.add_type('audio/opus', '.opus')
+mimetypes.add_type('image/webp', '.webp')
+mimetypes.add_type('image/heic', '.heic')
+
+def guess_mime_type(file_name, file_obj):
+    """Guesses the MIME type from the file name, reading the file header only for unknown extensions."""
+    mime_type = mimetypes.guess_type(file_name)[0]
+    if mime_type is None:
+        kind = filetype.guess(file_obj.read(8192))
+        file_obj.seek(0)
+        mime_type = kind.mime if kind else 'application/octet-stream'
+    return mime_type
+
+def upload_file_to_drive(service, file_name, file_obj, folder_id):
     try:
-        file_name = os.path.basename(file_path)
-        # Usa solo mimetypes per rilevare il tipo di file
-        mime_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+        mime_type = guess_mime_type(file_name, file_obj)
 
         file_metadata = {'name': file_name, 'parents': [folder_id]}
-        media = MediaFileUpload(file_path, mimetype=mime_type, resumable=True)
-        file = service.files().create(body=file_metadata, media_body=media, fields='id,webViewLink').execute()
-        logger.info(f"File '{file_name}' uploaded with ID: {file.get('id')}")
+        size = file_obj.seek(0, io.SEEK_END)
+        file_obj.seek(0)
+        # Small files go in a single multipart request, skipping the resumable session setup
+        resumable = size >= RESUMABLE_UPLOAD_THRESHOLD
+        media = MediaIoBaseUpload(file_obj, mimetype=mime_type, resumable=resumable, chunksize=UPLOAD_CHUNK_SIZE)
+        # Resumable chunks are retried within the same session; a multipart POST that failed
+        # may still have stored the file, so it is never resent
+        num_retries = DRIVE_NUM_RETRIES if resumable else 0
+        file = service.files().create(body=file_metadata, media_body=media, fields='id,webViewLink').execute(num_retries=num_retries)
+        logger.info("File '%s' uploaded with ID: %s", file_name, file.get('id'))
         return file.get('id'), file.get('webViewLink')
     except HttpError as error:
-        logger.error(f"Error uploading file '{file_path}': {error}")
+        logger.error("Error uploading file '%s': %s", file_name, error)
+        if error.resp.status in (403, 404):
+            # The destination may have been deleted on Drive since it was cached
+            forget_folder(folder_id)
         return None, None
 
+def get_folder_metadata(service, folder_id):
+    """Returns (name, parent_id) for a folder, asking Drive only if it isn't in FOLDER_METADATA."""
+    metadata = FOLDER_METADATA.get(folder_id)
+    if metadata is None:
+        file = service.files().get(fileId=folder_id, fields='name, parents').execute(num_retries=DRIVE_NUM_RETRIES)
+        parents = file.get('parents')
+        metadata = FOLDER_METADATA[folder_id] = (file['name'], parents[0] if parents else None)
+    return metadata
+
 def get_folder_path_string(service, folder_id):
     """Helper to get a readable path for a folder ID."""
     if folder_id == GOOGLE_DRIVE_PARENT_FOLDER_ID:
         return "/"
     try:
         path = []
-        file = service.files().get(fileId=folder_id, fields='name, parents').execute()
-        while 'parents' in file:
-            path.insert(0, file['name'])
-            parent_id = file['parents'][0]
-            if parent_id == GOOGLE_DRIVE_PARENT_FOLDER_ID:
+        current_id = folder_id
+        while current_id != GOOGLE_DRIVE_PARENT_FOLDER_ID:
+            name, parent_id = get_folder_metadata(service, current_id)
+            if parent_id is None:
                 break
-            file = service.files().get(fileId=parent_id, fields='name, parents').execute()
+            path.insert(0, name)
+            current_id = parent_id
         return "/" + "/".join(path)
     except Exception as e:
-        logger.error(f"Could not retrieve path for folder {folder_id}: {e}")
+        logger.error("Could not retrieve path for folder %s: %s", folder_id, e)
         return f"(unknown path for ID: {folder_id})"
 
+# Subfolders shown per page in the folder picker
+FOLDER_PAGE_SIZE = 20
+
+def list_subfolders(service, folder_id, page_token=None):
+    """Returns one page of subfolders of folder_id, sorted by name, and the next page token."""
+    query = f"'{folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
+    results = service.files().list(
+        q=query,
+        spaces='drive',
+        pageSize=FOLDER_PAGE_SIZE,
+        pageToken=page_token,
+        orderBy="name",
+        fields="nextPageToken, files(id, name)"
+    ).execute(num_retries=DRIVE_NUM_RETRIES)
+    items = results.get('files', [])
+    for item in items:
+        cache_folder(folder_id, item['name'], item['id'])
+    return items, results.get('nextPageToken')
+
 def list_files_in_folder(service, folder_id, page_size=10):
     """List files in a specific folder."""
     try:
         query = f"'{folder_id}' in parents and trashed=false"
         results = service.files().list(
             q=query,
+            spaces='drive',
             pageSize=page_size,
             orderBy="name",
-            fields="files(id, name, mimeType, size, createdTime, webViewLink)"
-        ).execute()
+            fields="files(id, name, mimeType, size)"
+        ).execute(num_retries=DRIVE_NUM_RETRIES)
         return results.get('files', [])
     except HttpError as error:
-        logger.error(f"Error listing files in folder {folder_id}: {error}")
+        logger.error("Error listing files in folder %s: %s", folder_id, error)
         return []
 
 def delete_file_from_drive(service, file_id):
     """Delete a file from Google Drive."""
     try:
         service.files().delete(fileId=file_id).execute()
-        logger.info(f"File with ID {file_id} deleted successfully.")
+        logger.info("File with ID %s deleted successfully.", file_id)
         return True
     except HttpError as error:
-        logger.error(f"Error deleting file {file_id}: {error}")
+        logger.error("Error deleting file %s: %s", file_id, error)
         return False
 
 def search_files_by_name(service, file_name, folder_id=None):
     """Search files by name in Drive."""
     try:
-        query = f"name contains '{file_name}' and trashed=false"
+        query = f"name contains '{escape_drive_query(file_name)}' and trashed=false"
         if folder_id:
             query += f" and '{folder_id}' in parents"
         
         results = service.files().list(
             q=query,
+            spaces='drive',
             pageSize=20,
             orderBy="name",
             fields="files(id, name, mimeType, webViewLink)"
-        ).execute()
+        ).execute(num_retries=DRIVE_NUM_RETRIES)
         return results.get('files', [])
     except HttpError as error:
-        logger.error(f"Error searching files: {error}")
+        logger.error("Error searching files: %s", error)
         return []
 
+# Bounded concurrency towards Drive: bursts queue up here instead of triggering 429 backoff
+UPLOAD_SEMAPHORE = asyncio.Semaphore(int(os.getenv('MAX_CONCURRENT_UPLOADS', '8')))
+DRIVE_API_SEMAPHORE = asyncio.Semaphore(int(os.getenv('MAX_CONCURRENT_DRIVE_CALLS', '4')))
+
+async def adrive(func, *args, **kwargs):
+    """Runs a blocking Google Drive call in a worker thread, off the event loop."""
+    async with DRIVE_API_SEMAPHORE:
+        return await asyncio.to_thread(func, *args, **kwargs)
+
+async def upload_to_drive_async(*args):
+    """Runs upload_file_to_drive in a worker thread, limited to MAX_CONCURRENT_UPLOADS at a time."""
+    async with UPLOAD_SEMAPHORE:
+        return await asyncio.to_thread(upload_file_to_drive, *args)
+
 # --- 🔒 ACCESS CONTROL FUNCTION ---
 async def check_access(update: Update) -> bool:
     """Verifica che l'utente sia autorizzato ad usare il bot."""
     user_id = update.effective_user.id
     user_name = update.effective_user.username or update.effective_user.first_name
     
-    if user_id != AUTHORIZED_USER_ID:
-        logger.warning(f"🚫 Accesso negato a user_id: {user_id} ({user_name})")
+    if user_id not in AUTHORIZED_USER_IDS:
+        logger.warning("🚫 Accesso negato a user_id: %s (%s)", user_id, user_name)
         try:
             await update.effective_message.reply_text("❌ Accesso non autorizzato.")
         except:
@@ -246,21 +600,21 @@ async def handle_attachment(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     # Handle different file types
     if message.document:
-        file_info = {'file_id': message.document.file_id, 'file_name': message.document.file_name}
-        logger.info(f"Document received from {user.first_name}: {file_info['file_name']}")
+        file_info = {'file_id': message.document.file_id, 'file_name': message.document.file_name or f"document_{message.message_id}"}
+        logger.info("Document received from %s: %s", user.first_name, file_info['file_name'])
     elif message.photo:
         photo = message.photo[-1]
         file_info = {'file_id': photo.file_id, 'file_name': f"photo_{message.message_id}.jpg"}
-        logger.info(f"Photo received from {user.first_name}.")
+        logger.info("Photo received from %s.", user.first_name)
     elif message.video:
         file_info = {'file_id': message.video.file_id, 'file_name': message.video.file_name or f"video_{message.message_id}.mp4"}
-        logger.info(f"Video received from {user.first_name}: {file_info.get('file_name')}")
+        logger.info("Video received from %s: %s", user.first_name, file_info.get('file_name'))
     elif message.audio:
         file_info = {'file_id': message.audio.file_id, 'file_name': message.audio.file_name or f"audio_{message.message_id}.mp3"}
-        logger.info(f"Audio received from {user.first_name}.")
+        logger.info("Audio received from %s.", user.first_name)
     elif message.voice:
         file_info = {'file_id': message.voice.file_id, 'file_name': f"voice_{message.message_id}.ogg"}
-        logger.info(f"Voice message received from {user.first_name}.")
+        logger.info("Voice message received from %s.", user.first_name)
     else:
         await message.reply_text("❌ Non posso gestire questo tipo di file.")
         return ConversationHandler.END
@@ -305,18 +659,30 @@ async def done_uploading_callback(update: Update, context: ContextTypes.DEFAULT_
     await show_folder_selection(query, context)
     return SELECT_FOLDER
 
-async def show_folder_selection(update, context: ContextTypes.DEFAULT_TYPE, folder_id: str = None):
+async def show_folder_selection(update, context: ContextTypes.DEFAULT_TYPE, folder_id: str = None, page_token: str = None):
     if folder_id is None:
         folder_id = GOOGLE_DRIVE_PARENT_FOLDER_ID
         context.user_data['current_folder_id'] = folder_id
         context.user_data['folder_path_stack'] = []
+    if page_token is None:
+        context.user_data['folder_prev_page_tokens'] = []
 
-    drive_service = get_drive_service()
-    query = f"'{folder_id}' in parents and mimeType='application/vnd.google-apps.folder' and trashed=false"
-    results = drive_service.files().list(q=query, pageSize=20, orderBy="name", fields="files(id, name)").execute()
-    items = results.get('files', [])
+    drive_service = await adrive(get_drive_service)
+    items, next_page_token = await adrive(list_subfolders, drive_service, folder_id, page_token)
+
+    # Tokens are kept so the user can move between pages of a folder with many subfolders
+    context.user_data['folder_page_token'] = page_token
+    context.user_data['folder_next_page_token'] = next_page_token
 
     keyboard = [[InlineKeyboardButton(f"📁 {item['name']}", callback_data=f"select_folder_{item['id']}")] for item in items]
+
+    page_buttons = []
+    if page_token:
+        page_buttons.append(InlineKeyboardButton("◀️ Precedenti", callback_data="prev_page"))
+    if context.user_data['folder_next_page_token']:
+        page_buttons.append(InlineKeyboardButton("Successive ▶️", callback_data="next_page"))
+    if page_buttons:
+        keyboard.append(page_buttons)
     
     control_buttons = [InlineKeyboardButton("✅ Seleziona questa cartella", callback_data="confirm_folder")]
     if context.user_data['folder_path_stack']:
@@ -326,7 +692,7 @@ async def show_folder_selection(update, context: ContextTypes.DEFAULT_TYPE, fold
     keyboard.append([InlineKeyboardButton("🔍 Cerca per percorso", callback_data="search_path")])
 
     reply_markup = InlineKeyboardMarkup(keyboard)
-    current_path_str = get_folder_path_string(drive_service, context.user_data['current_folder_id'])
+    current_path_str = await adrive(get_folder_path_string, drive_service, context.user_data['current_folder_id'])
 
     text = f"📂 Seleziona una cartella. Percorso corrente: `{current_path_str}`"
     
@@ -345,16 +711,27 @@ async def folder_selection_callback(update: Update, context: ContextTypes.DEFAUL
     query = update.callback_query
     await query.answer()
     data = query.data
-    drive_service = get_drive_service()
+    drive_service = await adrive(get_drive_service)
 
     if data.startswith("select_folder_"):
         folder_id = data.split("_", 2)[2]
-        folder_details = drive_service.files().get(fileId=context.user_data['current_folder_id'], fields='name').execute()
-        context.user_data['folder_path_stack'].append({'id': context.user_data['current_folder_id'], 'name': folder_details.get('name', '..')})
+        folder_name, _ = await adrive(get_folder_metadata, drive_service, context.user_data['current_folder_id'])
+        context.user_data['folder_path_stack'].append({'id': context.user_data['current_folder_id'], 'name': folder_name or '..'})
         context.user_data['current_folder_id'] = folder_id
         await show_folder_selection(query, context, folder_id)
         return SELECT_FOLDER
 
+    elif data == "next_page":
+        context.user_data['folder_prev_page_tokens'].append(context.user_data['folder_page_token'])
+        await show_folder_selection(query, context, context.user_data['current_folder_id'], context.user_data['folder_next_page_token'])
+        return SELECT_FOLDER
+
+    elif data == "prev_page":
+        prev_page_tokens = context.user_data['folder_prev_page_tokens']
+        page_token = prev_page_tokens.pop() if prev_page_tokens else None
+        await show_folder_selection(query, context, context.user_data['current_folder_id'], page_token)
+        return SELECT_FOLDER
+
     elif data == "back_folder":
         if context.user_data['folder_path_stack']:
             previous_folder = context.user_data['folder_path_stack'].pop()
@@ -365,7 +742,7 @@ async def folder_selection_callback(update: Update, context: ContextTypes.DEFAUL
     elif data == "confirm_folder":
         final_folder_id = context.user_data['current_folder_id']
         context.user_data['final_folder_id'] = final_folder_id
-        context.user_data['upload_path'] = get_folder_path_string(drive_service, final_folder_id)
+        context.user_data['upload_path'] = await adrive(get_folder_path_string, drive_service, final_folder_id)
         context.user_data['needs_creation'] = False
         
         reply_keyboard = [['Sì', 'No']]
@@ -392,77 +769,155 @@ async def get_path(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     context.user_data['upload_path'] = path_input
     
     reply_keyboard = [['Sì', 'No']]
-    drive_service = get_drive_service()
-    
-    final_folder_id = find_or_create_nested_folder(drive_service, path_input, GOOGLE_DRIVE_PARENT_FOLDER_ID)
+    # A retry with the same path right after answering "No" reuses the previous lookup
+    last_resolution = context.user_data.get('last_path_resolution')
+    if (last_resolution and last_resolution['path'] == path_input
+            and time.monotonic() - last_resolution['time'] < PATH_RESOLUTION_TTL):
+        folder_id, missing_parts = last_resolution['folder_id'], last_resolution['missing_parts']
+    else:
+        drive_service = await adrive(get_drive_service)
+        folder_id, missing_parts = await adrive(resolve_path, drive_service, path_input, GOOGLE_DRIVE_PARENT_FOLDER_ID)
+        if folder_id:
+            context.user_data['last_path_resolution'] = {
+                'path': path_input,
+                'folder_id': folder_id,
+                'missing_parts': missing_parts,
+                'time': time.monotonic(),
+            }
     
-    context.user_data['final_folder_id'] = final_folder_id
-    context.user_data['needs_creation'] = True
+    if not folder_id:
+        await update.message.reply_text("❌ Errore durante la verifica del percorso su Drive. Riprova.")
+        return GET_PATH
+
+    # The deepest existing folder is kept so confirm_upload only creates the missing suffix
+    context.user_data['final_folder_id'] = folder_id
+    context.user_data['missing_parts'] = missing_parts
+    context.user_data['needs_creation'] = bool(missing_parts)
+
+    if missing_parts:
+        text = f"📁 Il percorso `{path_input}` non esiste. Le cartelle mancanti (`{'/'.join(missing_parts)}`) verranno create.\n✅ Continuo?"
+    else:
+        text = f"📁 Il percorso `{path_input}` esiste già.\n✅ Continuo?"
 
     await update.message.reply_text(
-        f"📁 Il percorso sarà `{path_input}`. Se non esiste, verrà creato.\n✅ Continuo?",
+        text,
         reply_markup=ReplyKeyboardMarkup(reply_keyboard, one_time_keyboard=True), parse_mode='Markdown'
     )
     return CONFIRM_UPLOAD
 
+# Downloads stay in memory up to this size, larger files spill to a temporary file.
+# The default matches the Bot API download limit (20 MB), so files never touch the disk.
+SPOOL_MAX_SIZE = int(os.getenv('SPOOL_MAX_SIZE', str(20 * 1024 * 1024)))
+# How many files of the same upload request are downloaded/uploaded at the same time
+MAX_PARALLEL_FILES = int(os.getenv('MAX_PARALLEL_FILES', '4'))
+
+async def download_telegram_file(bot, file_info):
+    """Downloads a Telegram file into a spooled buffer, ready to be uploaded."""
+    new_file = await bot.get_file(file_info['file_id'])
+    buffer = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    try:
+        await new_file.download_to_memory(out=buffer)
+    except BaseException:
+        buffer.close()
+        raise
+    buffer.seek(0)
+    return buffer
+
+def discard_download(task):
+    """Cancels a download task that won't be consumed and closes its buffer if it already completed."""
+    def close_result(finished_task):
+        if finished_task.cancelled():
+            return
+        if finished_task.exception() is None:
+            finished_task.result().close()
+
+    task.cancel()
+    task.add_done_callback(close_result)
+
 async def confirm_upload(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     if not await check_access(update):
         return ConversationHandler.END
     
-    user_reply = update.message.text.lower()
+    user_reply = update.message.text.casefold().translate(ACCENTS_TABLE)
     
-    if user_reply not in ['sì', 'si', 'no']:
+    if user_reply not in YES_NO_ANSWERS:
         await update.message.reply_text("⚠️ Rispondi con 'Sì' o 'No'.")
         return CONFIRM_UPLOAD
         
     if user_reply == 'no':
         await update.message.reply_text("❌ Operazione annullata.", reply_markup=ReplyKeyboardRemove())
+        last_resolution = context.user_data.get('last_path_resolution')
         context.user_data.clear()
+        if last_resolution:
+            context.user_data['last_path_resolution'] = last_resolution
         return ConversationHandler.END
 
     files_to_upload = context.user_data.get('files_to_upload', [])
     path_info = context.user_data.get('upload_path')
     final_folder_id = context.user_data.get('final_folder_id')
-    drive_service = get_drive_service()
 
-    if context.user_data.get('needs_creation', False):
-         final_folder_id = find_or_create_nested_folder(drive_service, path_info, GOOGLE_DRIVE_PARENT_FOLDER_ID)
+    # The first file is fetched from Telegram while the destination folder is being prepared
+    prefetched_download = None
+    if files_to_upload:
+        prefetched_download = asyncio.create_task(download_telegram_file(context.bot, files_to_upload[0]))
+    upload_started = False
 
-    if not final_folder_id:
-         await update.message.reply_text("❌ Errore critico: impossibile trovare o creare la cartella di destinazione.", reply_markup=ReplyKeyboardRemove())
-         context.user_data.clear()
-         return ConversationHandler.END
+    try:
+        drive_service = await adrive(get_drive_service)
 
-    await update.message.reply_text(f"⏳ Caricamento di {len(files_to_upload)} file in corso...", reply_markup=ReplyKeyboardRemove())
+        if context.user_data.get('needs_creation', False):
+            # get_path already found where the existing prefix ends, only the missing suffix is created
+            final_folder_id = await adrive(create_folders, drive_service, context.user_data.get('missing_parts', []), final_folder_id)
 
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    download_dir = Path(os.path.join(script_dir, "temp_downloads"))
-    download_dir.mkdir(exist_ok=True)
-    
-    successful_uploads = 0
-    uploaded_links = []
-    
-    for file_info in files_to_upload:
-        file_path = download_dir / file_info['file_name']
-        try:
-            new_file = await context.bot.get_file(file_info['file_id'])
-            await new_file.download_to_drive(file_path)
-            logger.info(f"File '{file_info['file_name']}' downloaded to {file_path}")
-
-            uploaded_file_id, web_link = upload_file_to_drive(drive_service, file_path, final_folder_id)
-
-            if uploaded_file_id:
-                successful_uploads += 1
-                if web_link:
-                    uploaded_links.append(f"• [{file_info['file_name']}]({web_link})")
-            else:
-                await update.message.reply_text(f"❌ Errore durante il caricamento di '{file_info['file_name']}'.")
-        except Exception as e:
-            logger.error(f"Error processing file {file_info['file_name']}: {e}")
-            await update.message.reply_text(f"❌ Errore imprevisto con il file {file_info['file_name']}: {e}")
-        finally:
-            if os.path.exists(file_path):
-                os.remove(file_path)
+        if not final_folder_id:
+            await update.message.reply_text("❌ Errore critico: impossibile trovare o creare la cartella di destinazione.", reply_markup=ReplyKeyboardRemove())
+            context.user_data.clear()
+            return ConversationHandler.END
+
+        await update.message.reply_text(f"⏳ Caricamento di {len(files_to_upload)} file in corso...", reply_markup=ReplyKeyboardRemove())
+
+        # Files of a media group are transferred in parallel, a few at a time per conversation
+        file_semaphore = asyncio.Semaphore(MAX_PARALLEL_FILES)
+
+        async def process_file(file_info, pending_download=None):
+            buffer = None
+            async with file_semaphore:
+                try:
+                    if pending_download:
+                        buffer = await pending_download
+                    else:
+                        buffer = await download_telegram_file(context.bot, file_info)
+                    logger.info("File '%s' downloaded.", file_info['file_name'])
+
+                    uploaded_file_id, web_link = await upload_to_drive_async(drive_service, file_info['file_name'], buffer, final_folder_id)
+                    if not uploaded_file_id:
+                        await update.message.reply_text(f"❌ Errore durante il caricamento di '{file_info['file_name']}'.")
+                    return uploaded_file_id, web_link
+                except Exception as e:
+                    logger.error("Error processing file %s: %s", file_info['file_name'], e)
+                    await update.message.reply_text(f"❌ Errore imprevisto con il file {file_info['file_name']}: {e}")
+                    return None, None
+                finally:
+                    if buffer is not None:
+                        buffer.close()
+
+        # From here on process_file owns the prefetched download and closes its buffer
+        upload_started = True
+        results = await asyncio.gather(*(
+            process_file(file_info, prefetched_download if index == 0 else None)
+            for index, file_info in enumerate(files_to_upload)
+        ))
+    finally:
+        # Folder preparation failed or raised: the prefetched file would otherwise leak its buffer
+        if prefetched_download and not upload_started:
+            discard_download(prefetched_download)
+
+    successful_uploads = sum(1 for uploaded_file_id, _ in results if uploaded_file_id)
+    uploaded_links = [
+        f"• [{file_info['file_name']}]({web_link})"
+        for file_info, (uploaded_file_id, web_link) in zip(files_to_upload, results)
+        if uploaded_file_id and web_link
+    ]
 
     result_message = f"✅ *Completato!* {successful_uploads}/{len(files_to_upload)} file caricati in `{path_info}`"
     if uploaded_links:
@@ -472,25 +927,32 @@ async def confirm_upload(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     context.user_data.clear()
     return ConversationHandler.END
 
+async def upload_in_progress(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """Answers messages that arrive while confirm_upload is still running for this chat."""
+    if not await check_access(update):
+        return
+    await update.message.reply_text("⏳ Caricamento in corso, attendi che finisca. Invia di nuovo eventuali file al termine.")
+
 async def list_files_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """List files in current or specified folder."""
     if not await check_access(update):
         return
     
-    drive_service = get_drive_service()
+    drive_service = await adrive(get_drive_service)
     folder_id = GOOGLE_DRIVE_PARENT_FOLDER_ID
     
-    files = list_files_in_folder(drive_service, folder_id, page_size=20)
+    files = await adrive(list_files_in_folder, drive_service, folder_id, page_size=20)
     
     if not files:
         await update.message.reply_text("📂 Nessun file trovato in questa cartella.")
         return
     
-    message = "📋 *File nella cartella:*\n\n"
+    lines = []
     for file in files:
         icon = "📁" if file['mimeType'] == 'application/vnd.google-apps.folder' else "📄"
         size = f" ({int(file.get('size', 0)) / 1024:.1f} KB)" if 'size' in file else ""
-        message += f"{icon} `{file['name']}`{size}\n"
+        lines.append(f"{icon} `{file['name']}`{size}")
+    message = "📋 *File nella cartella:*\n\n" + "\n".join(lines)
     
     await update.message.reply_text(message, parse_mode='Markdown')
 
@@ -504,22 +966,23 @@ async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return
     
     search_query = ' '.join(context.args)
-    drive_service = get_drive_service()
+    drive_service = await adrive(get_drive_service)
     
-    files = search_files_by_name(drive_service, search_query)
+    files = await adrive(search_files_by_name, drive_service, search_query)
     
     if not files:
         await update.message.reply_text(f"❌ Nessun file trovato con nome '{search_query}'.")
         return
     
-    message = f"🔍 *Risultati per '{search_query}':*\n\n"
+    lines = []
     for file in files[:10]:
         icon = "📁" if file['mimeType'] == 'application/vnd.google-apps.folder' else "📄"
         link = file.get('webViewLink', '')
         if link:
-            message += f"{icon} [{file['name']}]({link})\n"
+            lines.append(f"{icon} [{file['name']}]({link})")
         else:
-            message += f"{icon} `{file['name']}`\n"
+            lines.append(f"{icon} `{file['name']}`")
+    message = f"🔍 *Risultati per '{search_query}':*\n\n" + "\n".join(lines)
     
     await update.message.reply_text(message, parse_mode='Markdown')
 
@@ -558,15 +1021,31 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
     if isinstance(update, Update) and update.effective_message:
         await update.effective_message.reply_text("❌ Si è verificato un errore imprevisto. Il problema è stato registrato.")
 
+async def post_init(application: Application) -> None:
+    application.bot_data['token_refresh_task'] = asyncio.create_task(token_refresh_loop())
+    application.bot_data['folder_tree_task'] = asyncio.create_task(folder_tree_refresh_loop())
+
+async def post_shutdown(application: Application) -> None:
+    for key in ('token_refresh_task', 'folder_tree_task'):
+        task = application.bot_data.get(key)
+        if task:
+            task.cancel()
+
 def main():
     if not TELEGRAM_TOKEN or not GOOGLE_DRIVE_PARENT_FOLDER_ID:
         logger.error("TELEGRAM_TOKEN or GOOGLE_DRIVE_PARENT_FOLDER_ID missing.")
         exit(1)
 
-    if AUTHORIZED_USER_ID == 123456789:
-        logger.warning("⚠️ ATTENZIONE: AUTHORIZED_USER_ID non è stato modificato! Ricorda di inserire il tuo vero User ID Telegram!")
+    if 123456789 in AUTHORIZED_USER_IDS:
+        logger.warning("⚠️ ATTENZIONE: AUTHORIZED_USER_IDS non è stato modificato! Ricorda di inserire il tuo vero User ID Telegram!")
 
-    application = Application.builder().token(TELEGRAM_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     conv_handler = ConversationHandler(
         entry_points=[MessageHandler(filters.ATTACHMENT, handle_attachment)],
@@ -577,7 +1056,10 @@ def main():
             ],
             SELECT_FOLDER: [CallbackQueryHandler(folder_selection_callback)],
             GET_PATH: [MessageHandler(filters.TEXT & ~filters.COMMAND, get_path)],
-            CONFIRM_UPLOAD: [MessageHandler(filters.Regex('^(Sì|sì|si|No|no)$'), confirm_upload)],
+            # The upload runs in the background so it doesn't hold up other users' messages;
+            # until it finishes the conversation stays in WAITING
+            CONFIRM_UPLOAD: [MessageHandler(filters.Regex(YES_NO_PATTERN), confirm_upload, block=False)],
+            ConversationHandler.WAITING: [MessageHandler(filters.ALL, upload_in_progress)],
         },
         fallbacks=[CommandHandler('cancel', cancel)],
         per_message=False
@@ -591,8 +1073,20 @@ def main():
     application.add_handler(conv_handler)
     
     logger.info("🤖 Bot avviato con successo! 🔒 Modalità privata attiva.")
-    logger.info(f"✅ Autorizzato solo user_id: {AUTHORIZED_USER_ID}")
-    application.run_polling(drop_pending_updates=True)
+    logger.info("✅ Autorizzati solo user_id: %s", ", ".join(str(user_id) for user_id in sorted(AUTHORIZED_USER_IDS)))
+    if PUBLIC_URL:
+        # Telegram pushes updates to us: no getUpdates round-trip per update
+        logger.info("🌐 Modalità webhook su %s (porta %s)", PUBLIC_URL, WEBHOOK_PORT)
+        application.run_webhook(
+            listen='0.0.0.0',
+            port=WEBHOOK_PORT,
+            url_path=TELEGRAM_TOKEN,
+            webhook_url=f"{PUBLIC_URL.rstrip('/')}/{TELEGRAM_TOKEN}",
+            secret_token=WEBHOOK_SECRET,
+            drop_pending_updates=True,
+        )
+    else:
+        application.run_polling(drop_pending_updates=True)
 
 if __name__ == '__main__':
     try:
@@ -600,6 +1094,6 @@ if __name__ == '__main__':
     except Exception as e:
         print(f"❌ ERRORE FATALE durante l'inizializzazione: {e}")
         exit(1)
-        
+
     logger.info("🚀 Avvio Telegram Bot...")
     main()
\ No newline at end of file